@@ -2,9 +2,10 @@ from flask import Flask
 from config import Config
 from routes import register_routes
 from models import init_db
+from scrubber import BlockScrubber
 import os
 
-def create_app():
+def create_app(use_reloader: bool = False):
     app = Flask(__name__)
     app.config.from_object(Config)
     
@@ -15,11 +16,29 @@ def create_app():
     # Initialiser la base de données
     init_db(app.config['DATABASE_PATH'])
     
+    # Scrubber d'intégrité (vérification et nettoyage des blocs)
+    app.scrubber = BlockScrubber(
+        app.config['DATABASE_PATH'],
+        batch_size=app.config['SCRUB_BATCH_SIZE'],
+        max_bytes_per_second=app.config['SCRUB_MAX_BYTES_PER_SECOND'],
+        orphan_grace_seconds=app.config['SCRUB_ORPHAN_GRACE'],
+        max_deletes_per_pass=app.config['SCRUB_MAX_DELETES'],
+        max_orphan_ratio=app.config['SCRUB_MAX_ORPHAN_RATIO'],
+        gc_interval=app.config['SCRUB_GC_INTERVAL'],
+        gc_page_size=app.config['SCRUB_GC_PAGE_SIZE'],
+        gc_page_delay=app.config['SCRUB_GC_PAGE_DELAY']
+    )
+    # Avec le reloader, seul le processus enfant (WERKZEUG_RUN_MAIN) sert les requêtes :
+    # ne pas lancer un second scrubber dans le processus qui surveille les fichiers
+    in_serving_process = not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    if app.config['SCRUB_ENABLED'] and in_serving_process:
+        app.scrubber.start(app.config['SCRUB_INTERVAL'])
+    
     # Enregistrer les routes
     register_routes(app)
     
     return app
 
 if __name__ == '__main__':
-    app = create_app()
-    app.run(debug=True, host='0.0.0.0', port=3000)
\ No newline at end of file
+    app = create_app(use_reloader=True)
+    app.run(debug=True, use_reloader=True, host='0.0.0.0', port=3000)
\ No newline at end of file
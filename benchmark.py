@@ -0,0 +1,371 @@
+"""Banc d'essai reproductible du pipeline de blocs.
+
+Démarre une flotte de receivers locaux (receiver_app, avec injection de latence,
+de bande passante limitée et de pannes), puis mesure distribute_file/reassemble_file
+(ou les routes HTTP) pour chaque combinaison de tailles de fichier, tailles de bloc
+et nombre de machines. Les résultats sont écrits en JSON pour comparer deux runs :
+
+    python benchmark.py --file-sizes 1M,16M --block-sizes 1M,4M --machines 1,3 --output run.json
+    python benchmark.py ... --compare baseline.json
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+
+
+def parse_size(value: str) -> int:
+    """Convertit '512K', '4M' ou '1G' en octets"""
+    value = value.strip().upper()
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def parse_list(value: str, parser=int) -> List:
+    return [parser(item) for item in value.split(',') if item.strip()]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """Pic de mémoire résidente du processus
+
+    Sous Linux, VmHWM ne couvre que l'image du programme en cours, alors que ru_maxrss
+    hérite du pic du processus parent. ru_maxrss est en Ko sous Linux, en octets sous macOS.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 2)
+
+
+class FaultInjector:
+    """Middleware WSGI simulant la latence, la bande passante et les pannes d'une machine"""
+
+    def __init__(self, app, latency: float = 0.0, bandwidth: int = 0, failure_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.app = app
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _transfer_delay(self, size: int):
+        if self.bandwidth > 0 and size > 0:
+            time.sleep(size / self.bandwidth)
+
+    def __call__(self, environ, start_response):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        path = environ.get('PATH_INFO', '')
+        with self._lock:
+            fail = self.random.random() < self.failure_rate
+        if fail and path in ('/upload_block', '/download_block'):
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json')])
+            return [b'{"error": "injected failure"}']
+
+        self._transfer_delay(int(environ.get('CONTENT_LENGTH') or 0))
+        iterable = self.app(environ, start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        self._transfer_delay(len(body))
+        return [body]
+
+
+class ReceiverFleet:
+    """Lance N receivers locaux sur des ports éphémères"""
+
+    def __init__(self, count: int, storage_root: str, latency: float, bandwidth: int,
+                 failure_rate: float, seed: int):
+        from werkzeug.serving import make_server
+        import receiver_app
+
+        self.servers = []
+        self.machines = []
+        for i in range(count):
+            app = FaultInjector(receiver_app.app, latency, bandwidth, failure_rate, seed + i)
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+            self.machines.append({
+                'name': f'bench-{i}',
+                'url': f'http://127.0.0.1:{server.server_port}',
+                'storage_path': os.path.join(storage_root, f'machine-{i}')
+            })
+
+    def shutdown(self):
+        for server in self.servers:
+            server.shutdown()
+
+
+class Benchmark:
+    def __init__(self, workdir: str, fleet: ReceiverFleet, mode: str):
+        self.workdir = workdir
+        self.fleet = fleet
+        self.mode = mode
+        self.upload_folder = os.path.join(workdir, 'uploads')
+        self.download_folder = os.path.join(workdir, 'downloads')
+        os.makedirs(self.upload_folder, exist_ok=True)
+        os.makedirs(self.download_folder, exist_ok=True)
+
+        # La configuration est lue à l'import : la fixer avant de charger l'application
+        os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+        os.environ['UPLOAD_FOLDER'] = self.upload_folder
+        os.environ['DOWNLOAD_FOLDER'] = self.download_folder
+        from app import create_app
+        from services import FileBlockService
+
+        self.app = create_app()
+        self.app.config['MAX_CONTENT_LENGTH'] = None
+        self.client = self.app.test_client()
+        self.service = FileBlockService(os.environ['DATABASE_PATH'])
+
+    def configure(self, machine_count: int, block_size: int):
+        machine_model = self.service.machine_model
+        for machine in machine_model.get_all_machines():
+            machine_model.delete_machine(machine['id'])
+        for machine in self.fleet.machines[:machine_count]:
+            machine_model.create_machine(machine['name'], machine['url'], machine['storage_path'])
+        self.service.settings_model.set_block_size(block_size)
+
+    def upload(self, name: str, data: bytes) -> Optional[int]:
+        if self.mode == 'http':
+            response = self.client.post(
+                '/upload', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data'
+            )
+            if response.status_code != 302:
+                return None
+            rows = self.service.db.execute_query(
+                'SELECT MAX(id) FROM files WHERE original_name = ?', (name,)
+            )
+            return rows[0][0]
+
+        from werkzeug.datastructures import FileStorage
+        success, _, file_id = self.service.distribute_file(
+            FileStorage(stream=io.BytesIO(data), filename=name), self.upload_folder
+        )
+        return file_id if success else None
+
+    def download(self, file_id: int) -> Optional[bytes]:
+        if self.mode == 'http':
+            response = self.client.get(f'/download/{file_id}')
+            return response.data if response.status_code == 200 else None
+
+        success, _, output_path = self.service.reassemble_file(file_id, self.download_folder)
+        if not success or output_path is None:
+            return None
+        with open(output_path, 'rb') as f:
+            data = f.read()
+        os.remove(output_path)
+        return data
+
+    def run_scenario(self, file_size: int, block_size: int, machine_count: int, iterations: int,
+                     seed: int) -> Dict:
+        self.configure(machine_count, block_size)
+        data = random.Random(seed).randbytes(file_size)
+
+        upload_times, download_times = [], []
+        failures = 0
+        for i in range(iterations):
+            # Un nom et un contenu distincts par itération pour éviter de partager les blocs
+            payload = i.to_bytes(8, 'big') + data[8:] if file_size >= 8 else data
+            name = f'bench_{file_size}_{block_size}_{machine_count}_{i}.bin'
+
+            # Seules les opérations réussies entrent dans les mesures de débit et de latence
+            started_at = time.perf_counter()
+            file_id = self.upload(name, payload)
+            elapsed = time.perf_counter() - started_at
+            if file_id is None:
+                failures += 1
+                continue
+            upload_times.append(elapsed)
+
+            started_at = time.perf_counter()
+            result = self.download(file_id)
+            elapsed = time.perf_counter() - started_at
+            if result == payload:
+                download_times.append(elapsed)
+            else:
+                failures += 1
+
+            self.service.delete_file(file_id)
+
+        return {
+            'file_size': file_size,
+            'block_size': block_size,
+            'machines': machine_count,
+            'iterations': iterations,
+            'failures': failures,
+            'upload': summarize(upload_times, file_size),
+            'download': summarize(download_times, file_size),
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+
+def summarize(times: List[float], size: int) -> Dict:
+    total = sum(times)
+    return {
+        'mb_per_s': round(size * len(times) / total / (1024 * 1024), 2) if total else 0.0,
+        'p50_ms': round(percentile(times, 50) * 1000, 2),
+        'p99_ms': round(percentile(times, 99) * 1000, 2)
+    }
+
+
+def scenario_key(result: Dict) -> tuple:
+    return result['file_size'], result['block_size'], result['machines']
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> List[str]:
+    """Liste les scénarios dont le débit a baissé, ou le pic mémoire augmenté, de plus de `threshold`"""
+    with open(baseline_path) as f:
+        baseline = {scenario_key(r): r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        reference = baseline.get(scenario_key(result))
+        if reference is None:
+            continue
+        for operation in ('upload', 'download'):
+            before = reference[operation]['mb_per_s']
+            after = result[operation]['mb_per_s']
+            if before and after < before * (1 - threshold):
+                regressions.append(
+                    f"{operation} file={result['file_size']} block={result['block_size']} "
+                    f"machines={result['machines']}: {before} -> {after} MB/s"
+                )
+        before, after = reference.get('peak_rss_mb'), result['peak_rss_mb']
+        if before and after > before * (1 + threshold):
+            regressions.append(
+                f"peak_rss file={result['file_size']} block={result['block_size']} "
+                f"machines={result['machines']}: {before} -> {after} MB"
+            )
+    return regressions
+
+
+def run_isolated(args: argparse.Namespace, file_size: int, block_size: int, machine_count: int) -> Dict:
+    """Exécute un scénario avec sa propre flotte ; appelé dans un processus neuf par scénario"""
+    workdir = tempfile.mkdtemp(prefix='fileblocks-bench-')
+    # receiver_app choisit son stockage à l'import
+    os.environ['BLOCK_STORAGE_BACKEND'] = args.backend
+    os.environ['BLOCK_PACK_DIR'] = os.path.join(workdir, 'pack')
+    fleet = ReceiverFleet(
+        machine_count, os.path.join(workdir, 'storage'),
+        args.latency, parse_size(args.bandwidth), args.failure_rate, args.seed
+    )
+    # receiver_app active les logs INFO à l'import : les couper pendant les mesures
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    try:
+        bench = Benchmark(workdir, fleet, args.mode)
+        return bench.run_scenario(file_size, block_size, machine_count, args.iterations, args.seed)
+    finally:
+        fleet.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file-sizes', default='1M,16M', help='tailles de fichier (ex: 512K,1M,64M)')
+    parser.add_argument('--block-sizes', default='1M,4M', help='tailles de bloc')
+    parser.add_argument('--machines', default='1,3', help='nombres de machines')
+    parser.add_argument('--iterations', type=int, default=5, help='répétitions par scénario')
+    parser.add_argument('--mode', choices=('service', 'http'), default='service',
+                        help='appeler FileBlockService directement ou passer par les routes Flask')
+    parser.add_argument('--backend', choices=('files', 'pack'), default='files',
+                        help='stockage des receivers (un fichier par bloc ou segments) ; '
+                             'en mode pack, tous les receivers partagent le même store')
+    parser.add_argument('--latency', type=float, default=0.0, help='latence ajoutée par requête (s)')
+    parser.add_argument('--bandwidth', default='0', help='bande passante par machine (ex: 100M), 0 = illimitée')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='proportion de requêtes en échec')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='fichier JSON de résultats (stdout par défaut)')
+    parser.add_argument('--compare', help='résultats de référence à comparer')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='baisse de débit ou hausse du pic mémoire tolérée (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    file_sizes = parse_list(args.file_sizes, parse_size)
+    block_sizes = parse_list(args.block_sizes, parse_size)
+    machine_counts = parse_list(args.machines)
+
+    # Un processus neuf par scénario : le pic mémoire mesuré est propre à chaque scénario
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for file_size in file_sizes:
+        for block_size in block_sizes:
+            for machine_count in machine_counts:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_isolated, args, file_size, block_size, machine_count).result()
+                results.append(result)
+                print(
+                    f"file={file_size} block={block_size} machines={machine_count}: "
+                    f"upload {result['upload']['mb_per_s']} MB/s, "
+                    f"download {result['download']['mb_per_s']} MB/s, "
+                    f"failures {result['failures']}, peak RSS {result['peak_rss_mb']} MB",
+                    file=sys.stderr
+                )
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mode': args.mode,
+            'backend': args.backend,
+            'latency': args.latency,
+            'bandwidth': parse_size(args.bandwidth),
+            'failure_rate': args.failure_rate,
+            'seed': args.seed
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
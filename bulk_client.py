@@ -0,0 +1,367 @@
+"""Client en ligne de commande pour les transferts groupés d'arborescences.
+
+Envoie ou télécharge des milliers de fichiers en parallèle via l'API JSON de
+l'application principale. Les petits fichiers sont regroupés dans une même requête,
+les fichiers déjà distribués (même nom, même hash) sont ignorés, et un manifeste
+local permet de reprendre un transfert interrompu :
+
+    python bulk_client.py upload ./photos --server http://localhost:3000 --prefix photos
+    python bulk_client.py download ./restore --server http://localhost:3000 --prefix photos
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+import requests
+from services import FileBlockService
+
+MANIFEST_NAME = '.fileblocks-manifest.jsonl'
+
+
+class Manifest:
+    """Journal local des fichiers transférés (une ligne JSON par fichier, la dernière l'emporte)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Ligne tronquée par une interruption
+                    self.entries[entry['path']] = entry
+        self._file = open(path, 'a')
+
+    def record(self, entry: Dict):
+        with self._lock:
+            self.entries[entry['path']] = entry
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class TransferStats:
+    """Compteurs agrégés du transfert"""
+
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self._last_report = self.started_at
+        self._lock = threading.Lock()
+
+    def add(self, files: int = 0, size: int = 0, skipped: int = 0, failed: int = 0):
+        with self._lock:
+            self.files += files
+            self.bytes += size
+            self.skipped += skipped
+            self.failed += failed
+
+    def summary(self) -> Dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'seconds': round(elapsed, 2),
+            'mb_per_s': round(self.bytes / elapsed / (1024 * 1024), 2),
+            'files_per_s': round(self.files / elapsed, 2)
+        }
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < 2:
+            return
+        self._last_report = now
+        s = self.summary()
+        done = s['files'] + s['skipped'] + s['failed']
+        print(
+            f"{done}/{self.total_files} fichiers, {s['mb_per_s']} MB/s, {s['files_per_s']} fichiers/s, "
+            f"{s['skipped']} ignorés, {s['failed']} en échec",
+            file=sys.stderr
+        )
+
+
+class BulkClient:
+    def __init__(self, server: str, jobs: int = 8, timeout: int = 600):
+        self.server = server.rstrip('/')
+        self.jobs = jobs
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        # Une session par thread pour réutiliser les connexions
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def find_existing(self, items: List[Dict]) -> Dict[str, int]:
+        existing = {}
+        for start in range(0, len(items), 1000):
+            response = self.session.post(
+                f"{self.server}/api/files/exists", json={'files': items[start:start + 1000]},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            existing.update(response.json()['existing'])
+        return existing
+
+    def list_files(self, prefix: str = '') -> List[Dict]:
+        """Parcourt tout le catalogue (le plus récent d'abord) ; un nom n'est gardé qu'une fois"""
+        files, seen, after = [], set(), None
+        while True:
+            params = {'limit': 500}
+            if prefix:
+                params['q'] = prefix
+            if after is not None:
+                params['after'] = after
+            response = self.session.get(f"{self.server}/api/files", params=params, timeout=self.timeout)
+            response.raise_for_status()
+            page = response.json()
+            for file in page['files']:
+                name = file['original_name']
+                if name.startswith(prefix) and name not in seen:
+                    seen.add(name)
+                    files.append(file)
+            after = page['next_cursor']
+            if after is None:
+                return files
+
+    def upload_batch(self, batch: List[Dict]) -> List[Dict]:
+        handles = [open(item['abs_path'], 'rb') for item in batch]
+        try:
+            response = self.session.post(
+                f"{self.server}/api/files/batch",
+                files=[('files', (item['name'], handle)) for item, handle in zip(batch, handles)],
+                timeout=self.timeout
+            )
+        finally:
+            for handle in handles:
+                handle.close()
+        response.raise_for_status()
+        return response.json()['results']
+
+    def download_file(self, file: Dict, target: str) -> bool:
+        """Télécharge un fichier, vérifie son hash puis le met en place"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.part"
+        response = self.session.get(
+            f"{self.server}/api/files/{file['id']}/content", stream=True, timeout=self.timeout
+        )
+        try:
+            if response.status_code != 200:
+                return False
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    f.write(chunk)
+        finally:
+            response.close()
+
+        if FileBlockService.calculate_file_hash(tmp_path) != file['file_hash']:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, target)
+        return True
+
+
+def walk_tree(root: str, exclude: Optional[str] = None) -> List[Dict]:
+    items = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            abs_path = os.path.join(dirpath, filename)
+            if exclude and os.path.abspath(abs_path) == os.path.abspath(exclude):
+                continue
+            stat = os.stat(abs_path)
+            items.append({
+                'path': os.path.relpath(abs_path, root).replace(os.sep, '/'),
+                'abs_path': abs_path,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime
+            })
+    return items
+
+
+def make_batches(items: List[Dict], batch_bytes: int, batch_files: int) -> List[List[Dict]]:
+    """Regroupe les petits fichiers ; un gros fichier forme un lot à lui seul"""
+    batches, current, current_bytes = [], [], 0
+    for item in sorted(items, key=lambda i: i['size']):
+        if current and (current_bytes + item['size'] > batch_bytes or len(current) >= batch_files):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(item)
+        current_bytes += item['size']
+    if current:
+        batches.append(current)
+    return batches
+
+
+def upload_tree(client: BulkClient, root: str, prefix: str, manifest: Manifest,
+                batch_bytes: int, batch_files: int) -> TransferStats:
+    items = walk_tree(root, exclude=manifest.path)
+    stats = TransferStats(len(items))
+
+    # Reprise : un fichier inchangé depuis son envoi n'est ni relu ni renvoyé
+    pending = []
+    for item in items:
+        item['name'] = prefix + item['path']
+        entry = manifest.entries.get(item['path'])
+        # L'entrée ne vaut que pour le même serveur et le même nom dans le catalogue (--server, --prefix)
+        if entry and entry.get('server') == client.server and entry.get('name') == item['name'] \
+                and entry.get('size') == item['size'] and entry.get('mtime') == item['mtime']:
+            stats.add(skipped=1)
+        else:
+            pending.append(item)
+
+    with ThreadPoolExecutor(max_workers=client.jobs) as executor:
+        hashes = executor.map(lambda i: FileBlockService.calculate_file_hash(i['abs_path']), pending)
+        for item, file_hash in zip(pending, hashes):
+            item['hash'] = file_hash
+
+    existing = client.find_existing([{'name': i['name'], 'hash': i['hash']} for i in pending])
+    to_send = []
+    for item in pending:
+        if item['name'] in existing:
+            manifest.record(upload_entry(client, item, existing[item['name']]))
+            stats.add(skipped=1)
+        else:
+            to_send.append(item)
+
+    with ThreadPoolExecutor(max_workers=client.jobs) as executor:
+        futures = {
+            executor.submit(client.upload_batch, batch): batch
+            for batch in make_batches(to_send, batch_bytes, batch_files)
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = {r['name']: r for r in future.result()}
+            except Exception as e:
+                print(f"Erreur lors de l'envoi d'un lot : {e}", file=sys.stderr)
+                results = {}
+            for item in batch:
+                result = results.get(item['name'])
+                if result and result['success']:
+                    manifest.record(upload_entry(client, item, result['file_id']))
+                    stats.add(files=1, size=item['size'])
+                else:
+                    message = result['message'] if result else 'lot en échec'
+                    print(f"Échec de {item['path']} : {message}", file=sys.stderr)
+                    stats.add(failed=1)
+            stats.report()
+    return stats
+
+
+def upload_entry(client: BulkClient, item: Dict, file_id: int) -> Dict:
+    return {
+        'path': item['path'], 'size': item['size'], 'mtime': item['mtime'],
+        'hash': item['hash'], 'file_id': file_id, 'name': item['name'], 'server': client.server
+    }
+
+
+def download_tree(client: BulkClient, dest: str, prefix: str, manifest: Manifest) -> TransferStats:
+    files = client.list_files(prefix)
+    stats = TransferStats(len(files))
+    dest_root = os.path.abspath(dest)
+
+    def transfer(file: Dict) -> str:
+        name = file['original_name']
+        path = name[len(prefix):]
+        target = os.path.abspath(os.path.join(dest_root, path))
+        if not target.startswith(dest_root + os.sep):
+            print(f"Nom ignoré (hors du dossier de destination) : {name}", file=sys.stderr)
+            return 'failed'
+
+        # Reprise : garder un fichier local identique
+        if os.path.exists(target) and os.path.getsize(target) == file['total_size']:
+            entry = manifest.entries.get(path)
+            recorded = entry and entry.get('server') == client.server and entry.get('name') == name \
+                and entry.get('hash') == file['file_hash'] and entry.get('mtime') == os.path.getmtime(target)
+            if recorded or FileBlockService.calculate_file_hash(target) == file['file_hash']:
+                return 'skipped'
+
+        if not client.download_file(file, target):
+            return 'failed'
+        # Même format que les entrées d'envoi : chemin relatif au dossier, serveur et nom dans le catalogue
+        manifest.record({
+            'path': path, 'size': file['total_size'], 'mtime': os.path.getmtime(target),
+            'hash': file['file_hash'], 'file_id': file['id'], 'name': name, 'server': client.server
+        })
+        return 'done'
+
+    with ThreadPoolExecutor(max_workers=client.jobs) as executor:
+        futures = {executor.submit(transfer, file): file for file in files}
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"Échec de {file['original_name']} : {e}", file=sys.stderr)
+                outcome = 'failed'
+            if outcome == 'done':
+                stats.add(files=1, size=file['total_size'])
+            else:
+                stats.add(skipped=int(outcome == 'skipped'), failed=int(outcome == 'failed'))
+            stats.report()
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', default='http://localhost:3000', help="URL de l'application principale")
+    parser.add_argument('--jobs', type=int, default=8, help='transferts en parallèle')
+    parser.add_argument('--manifest', help=f'manifeste de reprise (par défaut {MANIFEST_NAME} dans le dossier)')
+    parser.add_argument('--prefix', default='', help='préfixe des noms dans le catalogue (ex: photos/)')
+    parser.add_argument('--json', action='store_true', help='afficher le résumé en JSON')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    upload = subparsers.add_parser('upload', help='envoyer une arborescence')
+    upload.add_argument('source')
+    upload.add_argument('--batch-bytes', type=int, default=16 * 1024 * 1024,
+                        help='taille maximale des fichiers regroupés dans une requête')
+    upload.add_argument('--batch-files', type=int, default=64, help='nombre maximal de fichiers par requête')
+
+    download = subparsers.add_parser('download', help='télécharger une arborescence')
+    download.add_argument('dest')
+
+    args = parser.parse_args(argv)
+    prefix = args.prefix
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+
+    folder = args.source if args.command == 'upload' else args.dest
+    os.makedirs(folder, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(folder, MANIFEST_NAME))
+    client = BulkClient(args.server, args.jobs)
+    try:
+        if args.command == 'upload':
+            stats = upload_tree(client, args.source, prefix, manifest, args.batch_bytes, args.batch_files)
+        else:
+            stats = download_tree(client, args.dest, prefix, manifest)
+    finally:
+        manifest.close()
+
+    if args.json:
+        print(json.dumps(stats.summary()))
+    else:
+        stats.report(force=True)
+    return 1 if stats.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,4 +6,19 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
     DOWNLOAD_FOLDER = os.environ.get('DOWNLOAD_FOLDER') or 'downloads'
     MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB max
-    DEFAULT_BLOCK_SIZE = 20 * 1024 * 1024  # 20MB par défaut
\ No newline at end of file
+    DEFAULT_BLOCK_SIZE = 20 * 1024 * 1024  # 20MB par défaut
+    FILES_PAGE_SIZE = 50  # fichiers par page sur l'accueil et /api/files
+    FILES_PAGE_SIZE_MAX = 500
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # active les profils cProfile (en-tête X-Profile)
+    
+    # Scrubber d'intégrité et nettoyage des blocs orphelins
+    SCRUB_ENABLED = os.environ.get('SCRUB_ENABLED', 'false').lower() == 'true'
+    SCRUB_INTERVAL = int(os.environ.get('SCRUB_INTERVAL', 600))  # secondes entre deux passes
+    SCRUB_BATCH_SIZE = int(os.environ.get('SCRUB_BATCH_SIZE', 100))  # blocs vérifiés par passe
+    SCRUB_MAX_BYTES_PER_SECOND = int(os.environ.get('SCRUB_MAX_BYTES_PER_SECOND', 50 * 1024 * 1024))
+    SCRUB_ORPHAN_GRACE = int(os.environ.get('SCRUB_ORPHAN_GRACE', 3600))  # âge minimal d'un orphelin
+    SCRUB_MAX_DELETES = int(os.environ.get('SCRUB_MAX_DELETES', 500))  # suppressions max par passe
+    SCRUB_MAX_ORPHAN_RATIO = float(os.environ.get('SCRUB_MAX_ORPHAN_RATIO', 0.5))  # au-delà, nettoyage suspendu
+    SCRUB_GC_INTERVAL = int(os.environ.get('SCRUB_GC_INTERVAL', 86400))  # secondes entre deux nettoyages
+    SCRUB_GC_PAGE_SIZE = int(os.environ.get('SCRUB_GC_PAGE_SIZE', 1000))  # blocs par page d'inventaire
+    SCRUB_GC_PAGE_DELAY = float(os.environ.get('SCRUB_GC_PAGE_DELAY', 1.0))  # pause entre deux pages
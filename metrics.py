@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Bornes (en secondes) utilisées par défaut pour les histogrammes de latence
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        lines = []
+        for bound, count in zip(self.buckets, value['counts']):
+            labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+            lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+        lines.append(f'{self.name}_bucket{labels} {value["count"]}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {value["sum"]}')
+        lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {value["count"]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Réutiliser la métrique existante si le module est importé plusieurs fois
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Produit l'exposition au format texte Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'fileblocks_stage_seconds', 'Durée de chaque étape du pipeline de blocs', ('stage',)
+)
+
+# Trace de la requête en cours (une par thread de requête)
+_trace = threading.local()
+
+
+def start_trace():
+    _trace.spans = []
+
+
+def stop_trace() -> Optional[List[Dict]]:
+    spans = getattr(_trace, 'spans', None)
+    _trace.spans = None
+    return spans
+
+
+@contextmanager
+def timed(stage: str):
+    """Mesure une étape du pipeline et l'ajoute à la trace en cours"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        spans = getattr(_trace, 'spans', None)
+        if spans is not None:
+            spans.append({'stage': stage, 'seconds': elapsed})
+
+
+def summarize_trace(spans: List[Dict]) -> Dict[str, Dict]:
+    """Agrège les étapes d'une trace (nombre d'appels et durée totale)"""
+    summary: Dict[str, Dict] = {}
+    for span in spans:
+        entry = summary.setdefault(span['stage'], {'count': 0, 'seconds': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += span['seconds']
+    return summary
@@ -1,6 +1,7 @@
 import sqlite3
 import hashlib
 import os
+import re
 from datetime import datetime
 from typing import List, Dict, Optional
 
@@ -63,6 +64,60 @@ def init_db(db_path: str):
             FOREIGN KEY (file_id) REFERENCES files (id)
         )
     ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocks_hash ON blocks (block_hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocks_file ON blocks (file_id, block_number)')
+    # Index composite : sert aussi les recherches par machine seule (remplace idx_blocks_machine)
+    cursor.execute('DROP INDEX IF EXISTS idx_blocks_machine')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_blocks_location ON blocks (machine_url, storage_path)')
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_status ON files (status, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_hash ON files (file_hash)')
+    
+    # Totaux par statut, tenus à jour par des triggers (évite COUNT/SUM sur toute la table)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_stats'")
+    stats_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_stats (
+            status TEXT PRIMARY KEY,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            total_size INTEGER NOT NULL DEFAULT 0,
+            block_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if not stats_exists:
+        cursor.execute('''
+            INSERT INTO file_stats (status, file_count, total_size, block_count)
+            SELECT status, COUNT(*), SUM(total_size), SUM(block_count) FROM files GROUP BY status
+        ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS file_stats_insert AFTER INSERT ON files
+        BEGIN
+            INSERT OR IGNORE INTO file_stats (status) VALUES (NEW.status);
+            UPDATE file_stats SET file_count = file_count + 1, total_size = total_size + NEW.total_size,
+                block_count = block_count + NEW.block_count
+            WHERE status = NEW.status;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS file_stats_delete AFTER DELETE ON files
+        BEGIN
+            UPDATE file_stats SET file_count = file_count - 1, total_size = total_size - OLD.total_size,
+                block_count = block_count - OLD.block_count
+            WHERE status = OLD.status;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS file_stats_update AFTER UPDATE OF status, total_size, block_count ON files
+        BEGIN
+            UPDATE file_stats SET file_count = file_count - 1, total_size = total_size - OLD.total_size,
+                block_count = block_count - OLD.block_count
+            WHERE status = OLD.status;
+            INSERT OR IGNORE INTO file_stats (status) VALUES (NEW.status);
+            UPDATE file_stats SET file_count = file_count + 1, total_size = total_size + NEW.total_size,
+                block_count = block_count + NEW.block_count
+            WHERE status = NEW.status;
+        END
+    ''')
     
     # Table pour les machines
     cursor.execute('''
@@ -111,6 +166,80 @@ class FileModel:
             for row in rows
         ]
     
+    def get_files_page(self, status: Optional[str] = None, search: Optional[str] = None,
+                       after_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        """Page de fichiers (du plus récent au plus ancien) à partir du curseur after_id
+        
+        La recherche par préfixe de hash passe par idx_files_hash (intervalle sur l'hexadécimal) ;
+        la recherche dans les noms (LIKE '%...%') ne peut pas utiliser d'index et parcourt les
+        fichiers du statut dans l'ordre des id jusqu'à remplir la page.
+        """
+        conditions, params = [], []
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        if after_id is not None:
+            conditions.append('id < ?')
+            params.append(after_id)
+        
+        # Chaque critère de recherche forme sa propre requête, avec le meilleur index pour lui
+        branches = [('files', [], [])]
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            branches = [('files', ["original_name LIKE ? ESCAPE '\\'"], [f'%{escaped}%'])]
+            if re.fullmatch(r'[0-9a-fA-F]+', search):
+                prefix = search.lower()
+                # Les hash sont en hexadécimal minuscule : tout ce qui commence par le préfixe est < préfixe + 'g'.
+                # Sans statistiques, SQLite préférerait idx_files_status pour l'ordre des id : forcer l'index.
+                branches.append((
+                    'files INDEXED BY idx_files_hash', ['file_hash >= ?', 'file_hash < ?'], [prefix, prefix + 'g']
+                ))
+        
+        queries, query_params = [], []
+        for table, branch_conditions, branch_params in branches:
+            where_conditions = conditions + branch_conditions
+            where = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ''
+            queries.append(f'SELECT * FROM (SELECT * FROM {table} {where} ORDER BY id DESC LIMIT ?)')
+            query_params.extend(params + branch_params + [limit])
+        rows = self.db.execute_query(
+            f"{' UNION '.join(queries)} ORDER BY id DESC LIMIT ?", tuple(query_params) + (limit,)
+        )
+        return [
+            {
+                'id': row[0], 'original_name': row[1], 'file_hash': row[2],
+                'total_size': row[3], 'block_count': row[4], 'block_size': row[5],
+                'status': row[6], 'created_at': row[7]
+            }
+            for row in rows
+        ]
+    
+    def get_files_by_hashes(self, file_hashes: List[str], status: str) -> List[Dict]:
+        files = []
+        # Limite du nombre de paramètres SQLite
+        for start in range(0, len(file_hashes), 500):
+            chunk = file_hashes[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self.db.execute_query(
+                f'SELECT * FROM files WHERE status = ? AND file_hash IN ({placeholders})',
+                (status,) + tuple(chunk)
+            )
+            files.extend(
+                {
+                    'id': row[0], 'original_name': row[1], 'file_hash': row[2],
+                    'total_size': row[3], 'block_count': row[4], 'block_size': row[5],
+                    'status': row[6], 'created_at': row[7]
+                }
+                for row in rows
+            )
+        return files
+    
+    def get_files_stats(self, status: str) -> Dict:
+        rows = self.db.execute_query('''
+            SELECT file_count, total_size, block_count FROM file_stats WHERE status = ?
+        ''', (status,))
+        count, total_size, block_count = rows[0] if rows else (0, 0, 0)
+        return {'file_count': count, 'total_size': total_size, 'block_count': block_count}
+    
     def get_file_by_id(self, file_id: int) -> Optional[Dict]:
         rows = self.db.execute_query('SELECT * FROM files WHERE id = ?', (file_id,))
         if rows:
@@ -152,6 +281,62 @@ class BlockModel:
             for row in rows
         ]
     
+    def get_blocks_after_id(self, last_id: int, limit: int) -> List[Dict]:
+        rows = self.db.execute_query('''
+            SELECT * FROM blocks WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, limit))
+        return [
+            {
+                'id': row[0], 'file_id': row[1], 'block_number': row[2],
+                'block_hash': row[3], 'block_size': row[4], 'machine_url': row[5],
+                'storage_path': row[6], 'status': row[7], 'created_at': row[8]
+            }
+            for row in rows
+        ]
+    
+    def get_blocks_by_hash(self, block_hash: str) -> List[Dict]:
+        rows = self.db.execute_query('''
+            SELECT * FROM blocks WHERE block_hash = ? ORDER BY id
+        ''', (block_hash,))
+        return [
+            {
+                'id': row[0], 'file_id': row[1], 'block_number': row[2],
+                'block_hash': row[3], 'block_size': row[4], 'machine_url': row[5],
+                'storage_path': row[6], 'status': row[7], 'created_at': row[8]
+            }
+            for row in rows
+        ]
+    
+    def machine_has_blocks(self, machine_url: str) -> bool:
+        rows = self.db.execute_query('SELECT 1 FROM blocks WHERE machine_url = ? LIMIT 1', (machine_url,))
+        return bool(rows)
+    
+    def get_known_storage_paths(self, machine_url: str, storage_paths: List[str]) -> set:
+        """Parmi les chemins donnés, ceux qui sont référencés par un bloc de la machine"""
+        known = set()
+        # Limite du nombre de paramètres SQLite
+        for start in range(0, len(storage_paths), 500):
+            chunk = storage_paths[start:start + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            rows = self.db.execute_query(
+                f'SELECT storage_path FROM blocks WHERE machine_url = ? AND storage_path IN ({placeholders})',
+                (machine_url,) + tuple(chunk)
+            )
+            known.update(row[0] for row in rows)
+        return known
+    
+    def update_machine_url(self, old_url: str, new_url: str):
+        self.db.execute_query('UPDATE blocks SET machine_url = ? WHERE machine_url = ?', (new_url, old_url))
+    
+    def count_blocks_at_location(self, machine_url: str, storage_path: str) -> int:
+        rows = self.db.execute_query('''
+            SELECT COUNT(*) FROM blocks WHERE machine_url = ? AND storage_path = ?
+        ''', (machine_url, storage_path))
+        return rows[0][0]
+    
+    def update_block_status(self, block_id: int, status: str):
+        self.db.execute_query('UPDATE blocks SET status = ? WHERE id = ?', (status, block_id))
+    
     def delete_blocks_by_file_id(self, file_id: int):
         self.db.execute_query('DELETE FROM blocks WHERE file_id = ?', (file_id,))
 
@@ -175,6 +360,16 @@ class MachineModel:
             for row in rows
         ]
     
+    def get_machine_by_id(self, machine_id: int) -> Optional[Dict]:
+        rows = self.db.execute_query('SELECT * FROM machines WHERE id = ?', (machine_id,))
+        if rows:
+            row = rows[0]
+            return {
+                'id': row[0], 'name': row[1], 'url': row[2],
+                'storage_path': row[3], 'is_active': row[4], 'last_check': row[5]
+            }
+        return None
+    
     def get_active_machines(self) -> List[Dict]:
         rows = self.db.execute_query('SELECT * FROM machines WHERE is_active = TRUE ORDER BY name')
         return [
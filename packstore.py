@@ -0,0 +1,316 @@
+"""Stockage des blocs en segments (packfiles) pour les receivers.
+
+Au lieu d'un fichier par bloc, les blocs sont ajoutés à la suite dans de gros
+fichiers segments (segment-000001.pack, ...). Un index compact (index.log) associe
+chaque chemin de bloc à (segment, offset, longueur) ; il est rechargé au démarrage
+et les lectures passent par mmap. L'espace des blocs supprimés ou remplacés est
+récupéré en arrière-plan en recopiant les blocs vivants des segments trop vides.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Pattern, Tuple
+
+# En-tête des enregistrements dans les segments : magic, opération, longueur de clé, longueur des données
+RECORD_HEADER = struct.Struct('<4sBHQ')
+RECORD_MAGIC = b'FBPK'
+
+# Entrée de l'index : opération, longueur de clé, segment, offset, longueur, date
+INDEX_ENTRY = struct.Struct('<BHIQQd')
+
+OP_PUT = 1
+OP_DELETE = 2
+
+
+class PackStore:
+    def __init__(self, root: str, segment_size: int = 1024 * 1024 * 1024, fsync: bool = False):
+        self.root = root
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.index_path = os.path.join(root, 'index.log')
+        # chemin -> (segment, offset, longueur, date)
+        self.entries: Dict[str, Tuple[int, int, int, float]] = {}
+        self.live_bytes: Dict[int, int] = {}
+        # Clés triées pour paginer l'inventaire ; construites en une fois après le chargement de l'index
+        self._sorted_keys: Optional[List[str]] = None
+        self.index_records = 0
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.index_path):
+            self._load_index()
+        else:
+            self._rebuild_index()
+        self._sorted_keys = sorted(self.entries)
+
+        segments = self._segment_ids()
+        self.active_id = segments[-1] if segments else 1
+        self.active = open(self._segment_path(self.active_id), 'ab')
+        self.index = open(self.index_path, 'ab')
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.root, f'segment-{segment_id:06d}.pack')
+
+    def _segment_ids(self) -> List[int]:
+        ids = []
+        for name in os.listdir(self.root):
+            if name.startswith('segment-') and name.endswith('.pack'):
+                ids.append(int(name[len('segment-'):-len('.pack')]))
+        return sorted(ids)
+
+    def _apply(self, op: int, key: str, segment_id: int, offset: int, length: int, mtime: float):
+        # L'espace vivant inclut l'en-tête et la clé de l'enregistrement
+        overhead = RECORD_HEADER.size + len(key.encode('utf-8'))
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.live_bytes[previous[0]] = self.live_bytes.get(previous[0], 0) - previous[2] - overhead
+        if op == OP_PUT:
+            self.entries[key] = (segment_id, offset, length, mtime)
+            self.live_bytes[segment_id] = self.live_bytes.get(segment_id, 0) + length + overhead
+
+        if self._sorted_keys is not None:
+            if op == OP_PUT and previous is None:
+                bisect.insort(self._sorted_keys, key)
+            elif op == OP_DELETE and previous is not None:
+                del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key)]
+
+    def _load_index(self):
+        """Recharge l'index ; une entrée incomplète en fin de fichier (arrêt brutal) est ignorée"""
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        position = 0
+        while position + INDEX_ENTRY.size <= len(data):
+            op, key_len, segment_id, offset, length, mtime = INDEX_ENTRY.unpack_from(data, position)
+            end = position + INDEX_ENTRY.size + key_len
+            if end > len(data):
+                break
+            key = data[position + INDEX_ENTRY.size:end].decode('utf-8')
+            self._apply(op, key, segment_id, offset, length, mtime)
+            self.index_records += 1
+            position = end
+        if position < len(data):
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(position)
+
+    def _rebuild_index(self):
+        """Reconstruit l'index en relisant les segments (index absent)"""
+        for segment_id in self._segment_ids():
+            mtime = os.path.getmtime(self._segment_path(segment_id))
+            for op, key, offset, length in self._scan_segment(segment_id):
+                self._apply(op, key, segment_id, offset, length, mtime)
+        self._write_index()
+
+    def _scan_segment(self, segment_id: int):
+        with open(self._segment_path(segment_id), 'rb') as f:
+            position = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                magic, op, key_len, length = RECORD_HEADER.unpack(header)
+                if magic != RECORD_MAGIC:
+                    return
+                key = f.read(key_len)
+                if len(key) < key_len:
+                    return
+                offset = position + RECORD_HEADER.size + key_len
+                f.seek(length, os.SEEK_CUR)
+                position = offset + length
+                if position > os.fstat(f.fileno()).st_size:
+                    return
+                yield op, key.decode('utf-8'), offset, length
+
+    def _write_index(self):
+        """Réécrit l'index avec les seules entrées vivantes (remplacement atomique)"""
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for key, (segment_id, offset, length, mtime) in self.entries.items():
+                encoded = key.encode('utf-8')
+                f.write(INDEX_ENTRY.pack(OP_PUT, len(encoded), segment_id, offset, length, mtime) + encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self.index_records = len(self.entries)
+
+    def _append_index(self, op: int, key: str, segment_id: int, offset: int, length: int, mtime: float):
+        encoded = key.encode('utf-8')
+        self.index.write(INDEX_ENTRY.pack(op, len(encoded), segment_id, offset, length, mtime) + encoded)
+        self.index.flush()
+        if self.fsync:
+            os.fsync(self.index.fileno())
+        self.index_records += 1
+
+    def _append_record(self, op: int, key: str, data: bytes) -> Tuple[int, int]:
+        if self.active.tell() >= self.segment_size:
+            self.active.close()
+            self.active_id += 1
+            self.active = open(self._segment_path(self.active_id), 'ab')
+
+        encoded = key.encode('utf-8')
+        position = self.active.tell()
+        self.active.write(RECORD_HEADER.pack(RECORD_MAGIC, op, len(encoded), len(data)) + encoded)
+        self.active.write(data)
+        self.active.flush()
+        if self.fsync:
+            os.fsync(self.active.fileno())
+        return self.active_id, position + RECORD_HEADER.size + len(encoded)
+
+    def _sync(self):
+        for f in (self.active, self.index):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def put(self, key: str, data: bytes):
+        """Ajoute (ou remplace) un bloc"""
+        with self._lock:
+            segment_id, offset = self._append_record(OP_PUT, key, data)
+            mtime = time.time()
+            self._append_index(OP_PUT, key, segment_id, offset, len(data), mtime)
+            self._apply(OP_PUT, key, segment_id, offset, len(data), mtime)
+
+    def delete(self, key: str) -> bool:
+        """Supprime un bloc ; l'espace est récupéré par le compactage"""
+        with self._lock:
+            if key not in self.entries:
+                return False
+            # Tombstone dans le segment pour qu'une reconstruction de l'index ne le ressuscite pas
+            self._append_record(OP_DELETE, key, b'')
+            self._append_index(OP_DELETE, key, 0, 0, 0, time.time())
+            self._apply(OP_DELETE, key, 0, 0, 0, 0)
+            return True
+
+    def exists(self, key: str) -> bool:
+        return key in self.entries
+
+    def _map(self, segment_id: int, end: int) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(segment_id)
+            # Le segment actif grandit : le remapper si le bloc est au-delà de la projection actuelle
+            if mapped is None or len(mapped) < end:
+                with open(self._segment_path(segment_id), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[segment_id] = mapped
+            return mapped
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Lit un bloc via mmap"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            segment_id, offset, length, _ = entry
+            mapped = self._map(segment_id, offset + length)
+        return mapped[offset:offset + length]
+
+    def list(self, root: str, after: str = '', limit: Optional[int] = None,
+             name_pattern: Optional[Pattern] = None) -> List[Dict]:
+        """Inventaire des blocs dont le chemin commence par `root`, trié par chemin
+
+        Seuls les chemins strictement après `after` sont renvoyés, `limit` au plus. Avec
+        `name_pattern`, seuls les blocs placés directement sous `root` dont le nom correspond.
+        La page est lue à partir du curseur dans les clés triées (bisect), sans parcourir le reste.
+        """
+        prefix = root.rstrip('/') + '/'
+        blocks = []
+        with self._lock:
+            keys = self._sorted_keys
+            if after >= prefix:
+                position = bisect.bisect_right(keys, after)
+            else:
+                position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and (limit is None or len(blocks) < limit):
+                key = keys[position]
+                position += 1
+                if not key.startswith(prefix):
+                    break
+                if name_pattern is not None and not name_pattern.fullmatch(key[len(prefix):]):
+                    continue
+                _, _, length, mtime = self.entries[key]
+                blocks.append({'path': key, 'size': length, 'mtime': mtime})
+        return blocks
+
+    def compact(self, min_dead_ratio: float = 0.5) -> int:
+        """Recopie les blocs vivants des segments trop vides puis supprime ces segments
+
+        Les blocs sont lus hors du verrou du store : les envois et lectures ne sont bloqués
+        que le temps d'ajouter chaque copie.
+        """
+        reclaimed = 0
+        with self._compact_lock:
+            for segment_id in self._segment_ids():
+                with self._lock:
+                    if segment_id >= self.active_id:
+                        continue
+                    path = self._segment_path(segment_id)
+                    size = os.path.getsize(path)
+                    live = self.live_bytes.get(segment_id, 0)
+                    if size == 0 or 1 - live / size < min_dead_ratio:
+                        continue
+                    candidates = [
+                        (key, entry) for key, entry in self.entries.items() if entry[0] == segment_id
+                    ]
+                    mapped = self._map(segment_id, size) if candidates else None
+
+                for key, entry in candidates:
+                    _, offset, length, mtime = entry
+                    data = mapped[offset:offset + length]
+                    with self._lock:
+                        # Le bloc a pu être remplacé ou supprimé pendant la lecture
+                        if self.entries.get(key) != entry:
+                            continue
+                        new_segment, new_offset = self._append_record(OP_PUT, key, data)
+                        self._append_index(OP_PUT, key, new_segment, new_offset, length, mtime)
+                        self._apply(OP_PUT, key, new_segment, new_offset, length, mtime)
+
+                # Recopier les tombstones tant qu'un segment plus ancien peut contenir le bloc supprimé,
+                # sinon une reconstruction de l'index le ressusciterait
+                deleted = set()
+                if min(self._segment_ids()) < segment_id:
+                    deleted = {key for op, key, _, _ in self._scan_segment(segment_id) if op == OP_DELETE}
+
+                with self._lock:
+                    for key in deleted - set(self.entries):
+                        self._append_record(OP_DELETE, key, b'')
+                        self._append_index(OP_DELETE, key, 0, 0, 0, time.time())
+
+                    # Les copies doivent être sur disque avant de supprimer l'original, quel que soit self.fsync
+                    self._sync()
+
+                    # Les lecteurs qui détiennent encore la projection peuvent finir leur lecture
+                    self._maps.pop(segment_id, None)
+                    self.live_bytes.pop(segment_id, None)
+                    os.remove(path)
+                    reclaimed += size
+
+            # Réécrire l'index lorsqu'il contient surtout des entrées périmées
+            with self._lock:
+                if self.index_records > 2 * len(self.entries) + 1000:
+                    self.index.close()
+                    self._write_index()
+                    self.index = open(self.index_path, 'ab')
+        return reclaimed
+
+    def close(self):
+        with self._lock:
+            self.active.close()
+            self.index.close()
+            self._maps.clear()
+
+    def start_compactor(self, interval: int, min_dead_ratio: float = 0.5) -> threading.Thread:
+        """Lance le compactage périodique en tâche de fond"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact(min_dead_ratio)
+                except Exception as e:
+                    print(f"Erreur lors du compactage : {e}")
+
+        thread = threading.Thread(target=loop, name='pack-compactor', daemon=True)
+        thread.start()
+        return thread
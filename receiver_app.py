@@ -1,6 +1,13 @@
-from flask import Flask, request, abort, jsonify, send_file
+from flask import Flask, request, abort, jsonify, send_file, g, Response
+import io
 import os
+import time
+import hashlib
+import heapq
 import logging
+import re
+import metrics
+from packstore import PackStore
 
 app = Flask(__name__)
 
@@ -10,22 +17,75 @@ logging.basicConfig(level=logging.INFO)
 # Store your API key securely (env variable, config file, etc.)
 API_KEY = os.environ.get("BLOCK_RECEIVER_API_KEY", "super-secret-key")
 
+# Storage backend: "files" (one file per block at its storage path) or "pack"
+# (blocks appended to segment files under BLOCK_PACK_DIR, keyed by storage path)
+STORAGE_BACKEND = os.environ.get("BLOCK_STORAGE_BACKEND", "files")
+PACK_STORE = None
+if STORAGE_BACKEND == "pack":
+    PACK_STORE = PackStore(
+        os.environ.get("BLOCK_PACK_DIR", "blocks_pack"),
+        segment_size=int(os.environ.get("BLOCK_PACK_SEGMENT_SIZE", 1024 * 1024 * 1024))
+    )
+    PACK_STORE.start_compactor(int(os.environ.get("BLOCK_PACK_COMPACT_INTERVAL", 300)))
+
+# Metrics exposed on /metrics (Prometheus text format)
+REQUESTS = metrics.REGISTRY.counter(
+    'receiver_http_requests_total', 'HTTP requests handled by the receiver', ('endpoint', 'status')
+)
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'receiver_http_request_seconds', 'Receiver HTTP request duration', ('endpoint',)
+)
+BLOCK_BYTES = metrics.REGISTRY.counter(
+    'receiver_block_bytes_total', 'Block bytes stored or served', ('direction',)
+)
+INFLIGHT = metrics.REGISTRY.gauge(
+    'receiver_inflight_requests', 'Requests currently being handled'
+)
+
+@app.before_request
+def start_request_metrics():
+    g.started_at = time.perf_counter()
+    INFLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(time.perf_counter() - g.started_at, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    if 'started_at' in g:
+        INFLIGHT.dec()
+
 @app.route('/upload_block', methods=['POST'])
 def upload_block():
     # Authorization check
     if request.headers.get('X-API-KEY') != API_KEY:
         abort(403, description="Unauthorized")
 
-    block = request.files.get('block')
-    storage_path = request.form.get('path')
+    with metrics.timed('receive'):
+        block = request.files.get('block')
+        storage_path = request.form.get('path')
     logging.info(f"UPLOAD: block={block is not None}, storage_path={storage_path}")
     if not block or not storage_path:
         logging.warning("UPLOAD: Missing block or path")
         return jsonify({'error': 'Missing block or path'}), 400
 
     try:
+        if PACK_STORE is not None:
+            data = block.read()
+            with metrics.timed('store'):
+                PACK_STORE.put(os.path.normpath(storage_path), data)
+            BLOCK_BYTES.inc(len(data), direction='stored')
+            logging.info(f"UPLOAD: Block packed as {storage_path}")
+            return jsonify({'status': 'Block stored successfully'}), 200
+
         os.makedirs(os.path.dirname(storage_path), exist_ok=True)
-        block.save(storage_path)
+        with metrics.timed('store'):
+            block.save(storage_path)
+        BLOCK_BYTES.inc(os.path.getsize(storage_path), direction='stored')
         logging.info(f"UPLOAD: Block saved at {storage_path}")
         return jsonify({'status': 'Block stored successfully'}), 200
     except Exception as e:
@@ -36,16 +96,137 @@ def upload_block():
 def download_block():
     storage_path = request.args.get('path')
     logging.info(f"DOWNLOAD: Requested path: {storage_path}")
+    if PACK_STORE is not None:
+        data = PACK_STORE.get(os.path.normpath(storage_path)) if storage_path else None
+        if data is None:
+            logging.warning(f"DOWNLOAD: Block not found in pack store: {storage_path}")
+            return jsonify({'error': 'Block not found'}), 404
+        BLOCK_BYTES.inc(len(data), direction='served')
+        return send_file(io.BytesIO(data), as_attachment=True,
+                         download_name=os.path.basename(storage_path))
     if not storage_path or not os.path.exists(storage_path):
         logging.warning(f"DOWNLOAD: File not found at {storage_path}")
         return jsonify({'error': 'Block not found'}), 404
     try:
         logging.info(f"DOWNLOAD: File found, sending {storage_path}")
+        BLOCK_BYTES.inc(os.path.getsize(storage_path), direction='served')
         return send_file(storage_path, as_attachment=True)
     except Exception as e:
         logging.error(f"DOWNLOAD: Error sending file: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/hash_block')
+def hash_block():
+    # Le hash est calculé ici pour éviter de renvoyer le bloc au coordinateur
+    storage_path = request.args.get('path')
+    if PACK_STORE is not None:
+        data = PACK_STORE.get(os.path.normpath(storage_path)) if storage_path else None
+        if data is None:
+            return jsonify({'error': 'Block not found'}), 404
+        with metrics.timed('hash'):
+            block_hash = hashlib.sha256(data).hexdigest()
+        return jsonify({'hash': block_hash, 'size': len(data)}), 200
+    if not storage_path or not os.path.exists(storage_path):
+        logging.warning(f"HASH: File not found at {storage_path}")
+        return jsonify({'error': 'Block not found'}), 404
+    try:
+        hash_sha256 = hashlib.sha256()
+        with metrics.timed('hash'), open(storage_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hash_sha256.update(chunk)
+        return jsonify({
+            'hash': hash_sha256.hexdigest(),
+            'size': os.path.getsize(storage_path)
+        }), 200
+    except Exception as e:
+        logging.error(f"HASH: Error reading block: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/delete_block', methods=['DELETE'])
+def delete_block():
+    if request.headers.get('X-API-KEY') != API_KEY:
+        abort(403, description="Unauthorized")
+
+    storage_path = request.args.get('path')
+    logging.info(f"DELETE: Requested path: {storage_path}")
+    if PACK_STORE is not None:
+        if not storage_path or not PACK_STORE.delete(os.path.normpath(storage_path)):
+            return jsonify({'error': 'Block not found'}), 404
+        return jsonify({'status': 'Block deleted successfully'}), 200
+    if not storage_path or not os.path.isfile(storage_path):
+        return jsonify({'error': 'Block not found'}), 404
+    try:
+        os.remove(storage_path)
+        return jsonify({'status': 'Block deleted successfully'}), 200
+    except Exception as e:
+        logging.error(f"DELETE: Error deleting block: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Page size for /list_blocks (the coordinator walks the inventory page by page)
+LIST_PAGE_SIZE = 1000
+LIST_PAGE_SIZE_MAX = 10000
+
+# Blocks are written by the coordinator as <root>/<file sha256>_block_<n>: anything else
+# under the root (notes, subdirectories...) is not a block and is never listed
+BLOCK_NAME = re.compile(r'[0-9a-f]{64}_block_\d+')
+
+def iter_block_files(root, after_name=''):
+    """Yield block paths directly under root in name order, strictly after after_name.
+
+    Names are taken from a heap so a page only pays for sorting the entries it returns.
+    """
+    try:
+        with os.scandir(root) as it:
+            heap = [entry.name for entry in it
+                    if entry.name > after_name and BLOCK_NAME.fullmatch(entry.name)
+                    and entry.is_file(follow_symlinks=False)]
+    except OSError:
+        return
+    heapq.heapify(heap)
+    while heap:
+        yield os.path.join(root, heapq.heappop(heap))
+
+@app.route('/list_blocks')
+def list_blocks():
+    if request.headers.get('X-API-KEY') != API_KEY:
+        abort(403, description="Unauthorized")
+
+    root = request.args.get('root')
+    if not root:
+        return jsonify({'error': 'Missing root'}), 400
+    root = os.path.normpath(root)
+    after = request.args.get('after', '')
+    limit = min(max(request.args.get('limit', LIST_PAGE_SIZE, type=int), 1), LIST_PAGE_SIZE_MAX)
+
+    if PACK_STORE is not None:
+        blocks = PACK_STORE.list(root, after=after, limit=limit, name_pattern=BLOCK_NAME)
+        next_cursor = blocks[-1]['path'] if len(blocks) >= limit else None
+    elif not os.path.isdir(root):
+        blocks, next_cursor = [], None
+    else:
+        after_name = ''
+        if after and os.path.dirname(os.path.normpath(after)) == root:
+            after_name = os.path.basename(after)
+
+        blocks = []
+        next_cursor = None
+        # Only the entries of the requested page are stat()ed
+        for count, path in enumerate(iter_block_files(root, after_name), 1):
+            try:
+                stat = os.stat(path)
+                blocks.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+            except OSError:
+                pass  # Deleted in the meantime
+            if count >= limit:
+                next_cursor = path
+                break
+
+    return jsonify({'blocks': blocks, 'next': next_cursor}), 200
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/status')
 def status():
     return jsonify({'status': 'ok'}), 200
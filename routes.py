@@ -1,7 +1,17 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, g, Response
 from werkzeug.utils import secure_filename
 from services import FileBlockService, MachineService, SettingsService
+import metrics
+import cProfile
 import os
+import time
+
+HTTP_REQUESTS = metrics.REGISTRY.counter(
+    'fileblocks_http_requests_total', 'Requêtes HTTP traitées', ('endpoint', 'status')
+)
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'fileblocks_http_request_seconds', 'Durée des requêtes HTTP', ('endpoint',)
+)
 
 def register_routes(app):
     # Initialiser les services
@@ -9,12 +19,122 @@ def register_routes(app):
     machine_service = MachineService(app.config['DATABASE_PATH'])
     settings_service = SettingsService(app.config['DATABASE_PATH'])
     
+    @app.before_request
+    def start_request_metrics():
+        """Démarre la mesure (et éventuellement la trace/le profil) de la requête"""
+        g.started_at = time.perf_counter()
+        if request.args.get('trace') or request.headers.get('X-Trace'):
+            metrics.start_trace()
+            g.tracing = True
+        if app.config.get('PROFILE_DIR') and request.headers.get('X-Profile'):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+    
+    @app.after_request
+    def record_request_metrics(response):
+        """Enregistre les métriques HTTP et exporte la trace/le profil demandé"""
+        endpoint = request.endpoint or 'unknown'
+        if 'started_at' in g:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.started_at, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        
+        if g.pop('tracing', False):
+            spans = metrics.stop_trace() or []
+            summary = metrics.summarize_trace(spans)
+            if summary:
+                response.headers['Server-Timing'] = ', '.join(
+                    f"{stage};dur={entry['seconds'] * 1000:.2f}" for stage, entry in summary.items()
+                )
+            app.logger.info(f"TRACE {request.method} {request.path}: {summary}")
+        
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            profile_path = os.path.join(
+                app.config['PROFILE_DIR'], f"{int(time.time() * 1000)}_{endpoint}.prof"
+            )
+            profiler.dump_stats(profile_path)
+            response.headers['X-Profile-Path'] = profile_path
+        return response
+    
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Expose les métriques au format Prometheus"""
+        return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+    
+    def read_page_args():
+        """Lit les paramètres de pagination (recherche, curseur, taille de page)"""
+        search = request.args.get('q', '').strip() or None
+        after_id = request.args.get('after', type=int)
+        limit = request.args.get('limit', app.config['FILES_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['FILES_PAGE_SIZE_MAX']))
+        return search, after_id, limit
+    
     @app.route('/')
     def index():
         """Page d'accueil avec la liste des fichiers"""
-        files = file_service.get_files_list()
-        distributed_files = [f for f in files if f['status'] == 'distributed']
-        return render_template('index.html', files=distributed_files)
+        search, after_id, limit = read_page_args()
+        files, next_cursor = file_service.get_files_page(search, after_id, limit)
+        return render_template(
+            'index.html', files=files, next_cursor=next_cursor, search=search or '',
+            is_first_page=after_id is None, stats=file_service.get_catalog_stats()
+        )
+    
+    @app.route('/api/files')
+    def api_files():
+        """API paginée du catalogue de fichiers"""
+        search, after_id, limit = read_page_args()
+        files, next_cursor = file_service.get_files_page(search, after_id, limit)
+        return jsonify({'files': files, 'next_cursor': next_cursor})
+    
+    @app.route('/api/files/exists', methods=['POST'])
+    def api_files_exists():
+        """API indiquant quels fichiers (nom et hash) sont déjà distribués"""
+        payload = request.get_json(silent=True)
+        items = payload.get('files') if isinstance(payload, dict) else None
+        if not isinstance(items, list) or not all(
+            isinstance(item, dict) and isinstance(item.get('name'), str) and isinstance(item.get('hash'), str)
+            for item in items
+        ):
+            return jsonify({'error': 'Format attendu : {"files": [{"name": ..., "hash": ...}]}'}), 400
+        return jsonify({'existing': file_service.find_existing_files(items)})
+    
+    @app.route('/api/files/batch', methods=['POST'])
+    def api_files_batch():
+        """API d'envoi groupé : distribue chaque fichier de la requête"""
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({'error': 'Aucun fichier fourni'}), 400
+        
+        results = []
+        for file in files:
+            success, message, file_id = file_service.distribute_file(
+                file, app.config['UPLOAD_FOLDER']
+            )
+            results.append({
+                'name': file.filename, 'success': success,
+                'message': message, 'file_id': file_id
+            })
+        return jsonify({'results': results})
+    
+    @app.route('/api/files/<int:file_id>/content')
+    def api_file_content(file_id):
+        """API de téléchargement d'un fichier reassemblé"""
+        if file_service.get_file(file_id) is None:
+            return jsonify({'error': 'Fichier non trouvé'}), 404
+        
+        success, message, filepath = file_service.reassemble_file(
+            file_id, app.config['DOWNLOAD_FOLDER']
+        )
+        if not success or filepath is None:
+            return jsonify({'error': message}), 500
+        return send_reassembled_file(file_id, filepath)
+    
+    @app.route('/api/stats')
+    def api_stats():
+        """API des statistiques du catalogue"""
+        return jsonify(file_service.get_catalog_stats())
     
     @app.route('/upload', methods=['GET', 'POST'])
     def upload_file():
@@ -42,6 +162,16 @@ def register_routes(app):
         
         return render_template('upload.html')
     
+    def send_reassembled_file(file_id, filepath):
+        """Envoie un fichier reassemblé puis supprime la copie temporaire"""
+        file_info = file_service.get_file(file_id)
+        download_name = os.path.basename(file_info['original_name']) if file_info else None
+        response = send_file(filepath, as_attachment=True, download_name=download_name)
+        # Sans passthrough direct, Werkzeug appelle bien les fonctions call_on_close
+        response.direct_passthrough = False
+        response.call_on_close(lambda: os.path.exists(filepath) and os.remove(filepath))
+        return response
+    
     @app.route('/download/<int:file_id>')
     def download_file(file_id):
         """Télécharge et reassemble un fichier"""
@@ -51,7 +181,7 @@ def register_routes(app):
         
         if success and filepath is not None:
             flash(message, 'success')
-            return send_file(filepath, as_attachment=True)
+            return send_reassembled_file(file_id, filepath)
         else:
             flash(message, 'error')
             return redirect(url_for('index'))
@@ -88,8 +218,7 @@ def register_routes(app):
     @app.route('/machines/edit/<int:machine_id>', methods=['GET', 'POST'])
     def edit_machine(machine_id):
         """Éditer une machine"""
-        machines = machine_service.get_machines_list()
-        machine = next((m for m in machines if m['id'] == machine_id), None)
+        machine = machine_service.get_machine(machine_id)
         
         if not machine:
             flash('Machine non trouvée', 'error')
@@ -147,8 +276,22 @@ def register_routes(app):
     @app.route('/api/machines/status/<int:machine_id>')
     def check_machine_status(machine_id):
         """API pour vérifier le statut d'une machine"""
-        machines = machine_service.get_machines_list()
-        machine = next((m for m in machines if m['id'] == machine_id), None)
+        machine = machine_service.get_machine(machine_id)
         
         if not machine:
-            return jsonify({'error': 'Machine non trouvée'}), 404
\ No newline at end of file
+            return jsonify({'error': 'Machine non trouvée'}), 404
+        
+        return jsonify({
+            'id': machine['id'],
+            'name': machine['name'],
+            'online': machine_service.check_machine_status(machine['url'])
+        })
+    
+    @app.route('/api/scrub', methods=['GET', 'POST'])
+    def scrub():
+        """API pour consulter ou lancer une passe du scrubber"""
+        if request.method == 'POST':
+            # Une passe avec nettoyage peut durer longtemps : elle tourne hors de la requête
+            started = app.scrubber.run_in_background(force_gc=True)
+            return jsonify({'started': started, 'last_report': app.scrubber.last_report}), 202 if started else 409
+        return jsonify(app.scrubber.last_report)
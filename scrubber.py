@@ -0,0 +1,219 @@
+import hashlib
+import posixpath
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from services import FileBlockService
+
+# Nom des blocs écrits par distribute_file : <sha256 du fichier>_block_<numéro>
+BLOCK_NAME = re.compile(r'[0-9a-f]{64}_block_\d+')
+
+
+class BlockScrubber:
+    """Vérifie périodiquement l'intégrité des blocs et supprime les blocs orphelins"""
+
+    def __init__(self, db_path: str, batch_size: int = 100, max_bytes_per_second: int = 50 * 1024 * 1024,
+                 orphan_grace_seconds: int = 3600, max_deletes_per_pass: int = 500,
+                 max_orphan_ratio: float = 0.5, gc_interval: int = 86400, gc_page_size: int = 1000,
+                 gc_page_delay: float = 1.0):
+        self.file_service = FileBlockService(db_path)
+        self.block_model = self.file_service.block_model
+        self.machine_model = self.file_service.machine_model
+        self.settings_model = self.file_service.settings_model
+        self.batch_size = batch_size
+        self.max_bytes_per_second = max_bytes_per_second
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.max_deletes_per_pass = max_deletes_per_pass
+        self.max_orphan_ratio = max_orphan_ratio
+        self.gc_interval = gc_interval
+        self.gc_page_size = gc_page_size
+        self.gc_page_delay = gc_page_delay
+        self.last_report: Dict = {}
+        self._lock = threading.Lock()
+        self._manual_lock = threading.Lock()
+        self._manual_thread: Optional[threading.Thread] = None
+
+    def _throttle(self, started_at: float, size: int):
+        """Limite le débit de lecture imposé aux receivers"""
+        if self.max_bytes_per_second <= 0:
+            return
+        remaining = size / self.max_bytes_per_second - (time.monotonic() - started_at)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def repair_block(self, block: Dict) -> bool:
+        """Restaure un bloc à partir d'une autre copie saine du même contenu"""
+        for candidate in self.block_model.get_blocks_by_hash(block['block_hash']):
+            if candidate['id'] == block['id'] or candidate['status'] != 'stored':
+                continue
+            if (candidate['machine_url'], candidate['storage_path']) == (block['machine_url'], block['storage_path']):
+                continue
+
+            data = self.file_service.download_block_from_machine(
+                candidate['machine_url'], candidate['storage_path']
+            )
+            if data is None or hashlib.sha256(data).hexdigest() != block['block_hash']:
+                continue
+
+            if self.file_service.send_block_to_machine(data, block['machine_url'], block['storage_path']):
+                return True
+        return False
+
+    def scrub_blocks(self) -> Dict:
+        """Vérifie un lot de blocs à partir du dernier curseur enregistré"""
+        report = {'checked': 0, 'corrupted': 0, 'missing': 0, 'repaired': 0, 'unreachable': 0}
+        cursor = int(self.settings_model.get_setting('scrub_cursor', '0'))
+        blocks = self.block_model.get_blocks_after_id(cursor, self.batch_size)
+
+        for block in blocks:
+            started_at = time.monotonic()
+            reachable, remote_hash = self.file_service.hash_block_on_machine(
+                block['machine_url'], block['storage_path']
+            )
+            if not reachable:
+                # Machine indisponible : on n'en conclut rien sur le bloc
+                report['unreachable'] += 1
+                cursor = block['id']
+                continue
+
+            report['checked'] += 1
+            if remote_hash != block['block_hash']:
+                report['missing' if remote_hash is None else 'corrupted'] += 1
+                if self.repair_block(block):
+                    report['repaired'] += 1
+                    self.block_model.update_block_status(block['id'], 'stored')
+                else:
+                    self.block_model.update_block_status(block['id'], 'corrupted')
+            elif block['status'] != 'stored':
+                self.block_model.update_block_status(block['id'], 'stored')
+
+            cursor = block['id']
+            self._throttle(started_at, block['block_size'])
+
+        # Revenir au début une fois la table entièrement parcourue
+        if len(blocks) < self.batch_size:
+            cursor = 0
+        self.settings_model.set_setting('scrub_cursor', str(cursor))
+        return report
+
+    @staticmethod
+    def _is_block_path(machine: Dict, path: str) -> bool:
+        """Vrai pour un chemin au format écrit par distribute_file, directement sous storage_path"""
+        path = posixpath.normpath(path)
+        return (posixpath.dirname(path) == posixpath.normpath(machine['storage_path'])
+                and BLOCK_NAME.fullmatch(posixpath.basename(path)) is not None)
+
+    def _known_paths(self, machine: Dict, inventory: List[Dict]) -> set:
+        """Chemins (normalisés) d'une page d'inventaire qui sont référencés en base"""
+        candidates = {}
+        for entry in inventory:
+            path = posixpath.normpath(entry['path'])
+            # En base, les chemins sont construits comme "<storage_path>/<bloc>" sans normalisation
+            stored = f"{machine['storage_path']}/{posixpath.basename(path)}"
+            for variant in (entry['path'], path, stored):
+                candidates[variant] = path
+        known = self.block_model.get_known_storage_paths(machine['url'], list(candidates))
+        return {candidates[path] for path in known}
+
+    def collect_orphans(self) -> Dict:
+        """Supprime des machines les blocs qui ne sont plus référencés en base
+
+        L'inventaire est parcouru page par page, avec une pause entre deux pages ; les
+        suppressions n'ont lieu qu'une fois l'inventaire complet, si le garde-fou le permet.
+        """
+        report = {'orphans': 0, 'deleted': 0, 'skipped_machines': []}
+        now = time.time()
+
+        for machine in self.machine_model.get_active_machines():
+            # Garde-fou : aucun bloc connu signale plutôt une base désynchronisée qu'un nettoyage à faire
+            if not self.block_model.machine_has_blocks(machine['url']):
+                continue
+
+            cursor, seen, orphan_count, complete = None, 0, 0, False
+            # Seuls les orphelins qui pourront être supprimés pendant cette passe sont gardés en mémoire
+            candidates: List[str] = []
+            while True:
+                page: Optional[Tuple[List[Dict], Optional[str]]] = self.file_service.list_blocks_on_machine(
+                    machine['url'], machine['storage_path'], cursor, self.gc_page_size
+                )
+                if page is None:
+                    break
+                inventory, cursor = page
+                # Le receiver filtre déjà : ne jamais supprimer autre chose qu'un bloc, même d'un ancien receiver
+                inventory = [entry for entry in inventory if self._is_block_path(machine, entry['path'])]
+
+                known = self._known_paths(machine, inventory)
+                for entry in inventory:
+                    if posixpath.normpath(entry['path']) in known:
+                        continue
+                    # Laisser le temps aux envois en cours d'être enregistrés en base
+                    if now - entry['mtime'] < self.orphan_grace_seconds:
+                        continue
+                    orphan_count += 1
+                    if len(candidates) < self.max_deletes_per_pass - report['deleted']:
+                        candidates.append(entry['path'])
+                seen += len(inventory)
+
+                if cursor is None:
+                    complete = True
+                    break
+                time.sleep(self.gc_page_delay)
+
+            # Inventaire incomplet (machine injoignable en cours de route) : ne rien conclure
+            if not complete:
+                continue
+            # Garde-fou : trop d'orphelins signale un changement d'URL ou de chemin de stockage
+            if orphan_count > self.max_orphan_ratio * seen:
+                print(f"Nettoyage ignoré pour {machine['name']} : {orphan_count} orphelins "
+                      f"sur {seen} blocs")
+                report['skipped_machines'].append(machine['name'])
+                continue
+
+            report['orphans'] += orphan_count
+            for path in candidates:
+                if self.file_service.delete_block_from_machine(machine['url'], path):
+                    report['deleted'] += 1
+        return report
+
+    def run_once(self, force_gc: bool = False) -> Dict:
+        """Exécute une passe (vérification, puis nettoyage si son intervalle est écoulé)"""
+        with self._lock:
+            report = self.scrub_blocks()
+            last_gc = float(self.settings_model.get_setting('gc_last_run', '0'))
+            if force_gc or time.time() - last_gc >= self.gc_interval:
+                report.update(self.collect_orphans())
+                self.settings_model.set_setting('gc_last_run', str(time.time()))
+            report['finished_at'] = time.time()
+            self.last_report = report
+            return report
+
+    def run_in_background(self, force_gc: bool = False) -> bool:
+        """Lance une passe dans un thread séparé ; False si une passe manuelle est déjà en cours"""
+        with self._manual_lock:
+            if self._manual_thread is not None and self._manual_thread.is_alive():
+                return False
+
+            def run():
+                try:
+                    self.run_once(force_gc)
+                except Exception as e:
+                    print(f"Erreur du scrubber : {e}")
+
+            self._manual_thread = threading.Thread(target=run, name='block-scrubber-manual', daemon=True)
+            self._manual_thread.start()
+            return True
+
+    def start(self, interval: int) -> threading.Thread:
+        """Lance le scrubber en tâche de fond"""
+        def loop():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"Erreur du scrubber : {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='block-scrubber', daemon=True)
+        thread.start()
+        return thread
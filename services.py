@@ -1,10 +1,33 @@
 import os
 import hashlib
 import math
+import tempfile
+import time
 import requests
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterator, Optional, Tuple
 from werkzeug.datastructures import FileStorage
 from models import Database, FileModel, BlockModel, MachineModel, SettingsModel
+from metrics import REGISTRY, timed
+
+# Clé partagée avec les receivers (voir BLOCK_RECEIVER_API_KEY dans receiver_app.py)
+RECEIVER_API_KEY = os.environ.get('BLOCK_RECEIVER_API_KEY', 'super-secret-key')
+
+MACHINE_REQUEST_SECONDS = REGISTRY.histogram(
+    'fileblocks_machine_request_seconds', 'Latence des requêtes vers les machines', ('machine', 'operation')
+)
+MACHINE_BYTES = REGISTRY.counter(
+    'fileblocks_machine_bytes_total', 'Octets échangés avec les machines', ('machine', 'direction')
+)
+MACHINE_ERRORS = REGISTRY.counter(
+    'fileblocks_machine_errors_total', 'Requêtes en échec vers les machines', ('machine', 'operation')
+)
+FILE_OPERATIONS = REGISTRY.counter(
+    'fileblocks_file_operations_total', 'Opérations sur les fichiers', ('operation', 'result')
+)
+PENDING_BLOCKS = REGISTRY.gauge(
+    'fileblocks_pending_blocks', 'Blocs en attente de transfert', ('operation',)
+)
+
 
 class FileBlockService:
     def __init__(self, db_path: str):
@@ -14,43 +37,48 @@ class FileBlockService:
         self.machine_model = MachineModel(self.db)
         self.settings_model = SettingsModel(self.db)
 
-    def calculate_file_hash(self, filepath: str) -> str:
+    @staticmethod
+    def calculate_file_hash(filepath: str) -> str:
         """Calcule le hash SHA-256 d'un fichier"""
         hash_sha256 = hashlib.sha256()
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+        with timed('file_hash'), open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 hash_sha256.update(chunk)
         return hash_sha256.hexdigest()
     
     def split_file_into_blocks(self, filepath: str, block_size: int) -> List[Dict]:
         """Divise un fichier en blocs"""
+        return list(self.iter_file_blocks(filepath, block_size))
+    
+    def iter_file_blocks(self, filepath: str, block_size: int) -> Iterator[Dict]:
+        """Parcourt les blocs d'un fichier sans les garder tous en mémoire"""
         file_size = os.path.getsize(filepath)
         block_count = math.ceil(file_size / block_size)
-        blocks = []
         
         with open(filepath, 'rb') as f:
             for i in range(block_count):
-                block_data = f.read(block_size)
+                with timed('read'):
+                    block_data = f.read(block_size)
                 if not block_data:
                     break
                 
-                block_hash = hashlib.sha256(block_data).hexdigest()
-                blocks.append({
+                with timed('hash'):
+                    block_hash = hashlib.sha256(block_data).hexdigest()
+                yield {
                     'number': i,
                     'data': block_data,
                     'hash': block_hash,
                     'size': len(block_data)
-                })
-        
-        return blocks
+                }
     
     def send_block_to_machine(self, block_data: bytes, machine_url: str, storage_path: str) -> bool:
         """Envoie un bloc vers une machine distante"""
+        started_at = time.perf_counter()
         try:
             files = {'block': block_data}
             data = {'path': storage_path}
             
-            headers = {'X-API-KEY': 'super-secret-key'} # TODO: change this to a real secret key
+            headers = {'X-API-KEY': RECEIVER_API_KEY}
             response = requests.post(
                 f"{machine_url}/upload_block",
                 files=files,
@@ -59,13 +87,20 @@ class FileBlockService:
                 timeout=60
             )
             
-            return response.status_code == 200
+            MACHINE_REQUEST_SECONDS.observe(time.perf_counter() - started_at, machine=machine_url, operation='upload')
+            if response.status_code != 200:
+                MACHINE_ERRORS.inc(machine=machine_url, operation='upload')
+                return False
+            MACHINE_BYTES.inc(len(block_data), machine=machine_url, direction='sent')
+            return True
         except Exception as e:
+            MACHINE_ERRORS.inc(machine=machine_url, operation='upload')
             print(f"Erreur lors de l'envoi du bloc : {e}")
             return False
     
     def download_block_from_machine(self, machine_url: str, storage_path: str) -> Optional[bytes]:
         """Télécharge un bloc depuis une machine distante"""
+        started_at = time.perf_counter()
         try:
             response = requests.get(
                 f"{machine_url}/download_block",
@@ -73,30 +108,93 @@ class FileBlockService:
                 timeout=60
             )
             
+            MACHINE_REQUEST_SECONDS.observe(time.perf_counter() - started_at, machine=machine_url, operation='download')
             if response.status_code == 200:
+                MACHINE_BYTES.inc(len(response.content), machine=machine_url, direction='received')
                 return response.content
+            MACHINE_ERRORS.inc(machine=machine_url, operation='download')
             return None
         except Exception as e:
+            MACHINE_ERRORS.inc(machine=machine_url, operation='download')
             print(f"Erreur lors du téléchargement du bloc : {e}")
             return None
     
+    def hash_block_on_machine(self, machine_url: str, storage_path: str) -> Tuple[bool, Optional[str]]:
+        """Demande à une machine distante le hash d'un bloc (machine joignable, hash ou None si absent)"""
+        try:
+            response = requests.get(
+                f"{machine_url}/hash_block",
+                params={'path': storage_path},
+                timeout=60
+            )
+            
+            if response.status_code == 200:
+                return True, response.json().get('hash')
+            if response.status_code == 404:
+                return True, None
+            return False, None
+        except Exception as e:
+            print(f"Erreur lors de la vérification du bloc : {e}")
+            return False, None
+    
+    def list_blocks_on_machine(self, machine_url: str, root: str, after: Optional[str] = None,
+                               limit: int = 1000) -> Optional[Tuple[List[Dict], Optional[str]]]:
+        """Récupère une page de l'inventaire des blocs stockés sur une machine distante
+        
+        Retourne (blocs, curseur de la page suivante) ou None si la machine ne répond pas.
+        """
+        try:
+            params = {'root': root, 'limit': limit}
+            if after:
+                params['after'] = after
+            response = requests.get(
+                f"{machine_url}/list_blocks",
+                params=params,
+                headers={'X-API-KEY': RECEIVER_API_KEY},
+                timeout=120
+            )
+            
+            if response.status_code == 200:
+                payload = response.json()
+                return payload.get('blocks', []), payload.get('next')
+            return None
+        except Exception as e:
+            print(f"Erreur lors de l'inventaire des blocs : {e}")
+            return None
+    
+    def delete_block_from_machine(self, machine_url: str, storage_path: str) -> bool:
+        """Supprime un bloc d'une machine distante"""
+        try:
+            response = requests.delete(
+                f"{machine_url}/delete_block",
+                params={'path': storage_path},
+                headers={'X-API-KEY': RECEIVER_API_KEY},
+                timeout=30
+            )
+            
+            return response.status_code in (200, 404)
+        except Exception as e:
+            print(f"Erreur lors de la suppression du bloc : {e}")
+            return False
+    
     def distribute_file(self, file_storage: FileStorage, upload_folder: str) -> Tuple[bool, str, Optional[int]]:
         """Distribue un fichier sur les machines disponibles"""
+        filepath = None
         try:
-            # Sauvegarder le fichier temporairement
             filename = file_storage.filename
             if filename is None:
                 return False, "Nom de fichier manquant", None
-            filepath = os.path.join(upload_folder, filename)
+            
+            # Sauvegarder le fichier temporairement (nom unique : envois concurrents, chemins relatifs)
+            fd, filepath = tempfile.mkstemp(prefix='upload_', dir=upload_folder)
+            os.close(fd)
             file_storage.save(filepath)
             
             # Calculer les informations du fichier
             file_hash = self.calculate_file_hash(filepath)
             file_size = os.path.getsize(filepath)
             block_size = self.settings_model.get_block_size()
-            
-            # Diviser en blocs
-            blocks = self.split_file_into_blocks(filepath, block_size)
+            block_count = math.ceil(file_size / block_size)
             
             # Vérifier les machines disponibles
             machines = self.machine_model.get_active_machines()
@@ -105,42 +203,57 @@ class FileBlockService:
             
             # Créer l'entrée du fichier
             file_id = self.file_model.create_file(
-                filename, file_hash, file_size, len(blocks), block_size
+                filename, file_hash, file_size, block_count, block_size
             )
             if file_id is None:
                 return False, "Erreur lors de la création du fichier en base", None
 
-            # Distribuer les blocs
-            for i, block in enumerate(blocks):
-                machine = machines[i % len(machines)]
-                block_filename = f"{file_hash}_block_{block['number']}"
-                storage_path = f"{machine['storage_path']}/{block_filename}"
-                
-                success = self.send_block_to_machine(
-                    block['data'], machine['url'], storage_path
-                )
-                
-                if success:
-                    self.block_model.create_block(
-                        file_id, block['number'], block['hash'], 
-                        block['size'], machine['url'], storage_path
-                    )
-                else:
-                    # Nettoyer en cas d'échec
-                    self.file_model.delete_file(file_id)
-                    self.block_model.delete_blocks_by_file_id(file_id)
-                    return False, f"Échec de l'envoi du bloc {block['number']}", None
-            
-            # Nettoyer le fichier temporaire
-            os.remove(filepath)
+            # Distribuer les blocs (lus un par un pour limiter la mémoire)
+            remaining = block_count
+            PENDING_BLOCKS.inc(remaining, operation='upload')
+            try:
+                for i, block in enumerate(self.iter_file_blocks(filepath, block_size)):
+                    machine = machines[i % len(machines)]
+                    block_filename = f"{file_hash}_block_{block['number']}"
+                    storage_path = f"{machine['storage_path']}/{block_filename}"
+                    
+                    with timed('send'):
+                        success = self.send_block_to_machine(
+                            block['data'], machine['url'], storage_path
+                        )
+                    remaining -= 1
+                    PENDING_BLOCKS.dec(operation='upload')
+                    
+                    if success:
+                        with timed('db_insert'):
+                            self.block_model.create_block(
+                                file_id, block['number'], block['hash'], 
+                                block['size'], machine['url'], storage_path
+                            )
+                    else:
+                        # Nettoyer en cas d'échec
+                        self.file_model.delete_file(file_id)
+                        self.block_model.delete_blocks_by_file_id(file_id)
+                        FILE_OPERATIONS.inc(operation='upload', result='error')
+                        return False, f"Échec de l'envoi du bloc {block['number']}", None
+            finally:
+                PENDING_BLOCKS.dec(remaining, operation='upload')
             
+            FILE_OPERATIONS.inc(operation='upload', result='success')
             return True, "Fichier distribué avec succès", file_id
             
         except Exception as e:
+            FILE_OPERATIONS.inc(operation='upload', result='error')
             return False, f"Erreur lors de la distribution : {str(e)}", None
+        finally:
+            # Nettoyer le fichier temporaire
+            if filepath is not None and os.path.exists(filepath):
+                os.remove(filepath)
     
     def reassemble_file(self, file_id: int, download_folder: str) -> Tuple[bool, str, Optional[str]]:
         """Reassemble un fichier à partir de ses blocs"""
+        output_path = None
+        completed = False
         try:
             # Récupérer les informations du fichier
             file_info = self.file_model.get_file_by_id(file_id)
@@ -149,31 +262,56 @@ class FileBlockService:
             
             # Récupérer les blocs
             blocks = self.block_model.get_blocks_by_file_id(file_id)
-            if not blocks:
+            # Un fichier vide n'a aucun bloc : il est reassemblé en fichier vide
+            if not blocks and file_info['block_count'] > 0:
                 return False, "Aucun bloc trouvé", None
             
-            # Créer le fichier de sortie
-            output_path = os.path.join(download_folder, file_info['original_name'])
+            # Créer le fichier de sortie (nom unique : téléchargements concurrents, chemins relatifs)
+            fd, output_path = tempfile.mkstemp(
+                prefix=f"{file_id}_", suffix=f"_{os.path.basename(file_info['original_name'])}",
+                dir=download_folder
+            )
+            os.close(fd)
             
-            with open(output_path, 'wb') as output_file:
-                for block in blocks:    
-                    block_data = self.download_block_from_machine(
-                        block['machine_url'], block['storage_path']
-                    )
-                    
-                    if block_data is None:
-                        return False, f"Échec du téléchargement du bloc {block['block_number']}", None
-                    
-                    # Vérifier l'intégrité
-                    if hashlib.sha256(block_data).hexdigest() != block['block_hash']:
-                        return False, f"Erreur d'intégrité pour le bloc {block['block_number']}", None
-                    
-                    output_file.write(block_data)
+            remaining = len(blocks)
+            PENDING_BLOCKS.inc(remaining, operation='download')
+            try:
+                with open(output_path, 'wb') as output_file:
+                    for block in blocks:    
+                        with timed('fetch'):
+                            block_data = self.download_block_from_machine(
+                                block['machine_url'], block['storage_path']
+                            )
+                        remaining -= 1
+                        PENDING_BLOCKS.dec(operation='download')
+                        
+                        if block_data is None:
+                            FILE_OPERATIONS.inc(operation='download', result='error')
+                            return False, f"Échec du téléchargement du bloc {block['block_number']}", None
+                        
+                        # Vérifier l'intégrité
+                        with timed('verify'):
+                            valid = hashlib.sha256(block_data).hexdigest() == block['block_hash']
+                        if not valid:
+                            FILE_OPERATIONS.inc(operation='download', result='error')
+                            return False, f"Erreur d'intégrité pour le bloc {block['block_number']}", None
+                        
+                        with timed('write'):
+                            output_file.write(block_data)
+            finally:
+                PENDING_BLOCKS.dec(remaining, operation='download')
             
+            completed = True
+            FILE_OPERATIONS.inc(operation='download', result='success')
             return True, "Fichier reassemblé avec succès", output_path
             
         except Exception as e:
+            FILE_OPERATIONS.inc(operation='download', result='error')
             return False, f"Erreur lors du reassemblage : {str(e)}", None
+        finally:
+            # Ne pas laisser de fichier partiel en cas d'échec
+            if not completed and output_path is not None and os.path.exists(output_path):
+                os.remove(output_path)
     
     def get_files_list(self) -> List[Dict]:
         """Récupère la liste des fichiers avec informations formatées"""
@@ -183,6 +321,41 @@ class FileBlockService:
             file['block_size_mb'] = round(file['block_size'] / (1024 * 1024), 2)
         return files
     
+    def get_file(self, file_id: int) -> Optional[Dict]:
+        """Récupère les informations d'un fichier"""
+        return self.file_model.get_file_by_id(file_id)
+    
+    def find_existing_files(self, items: List[Dict]) -> Dict[str, int]:
+        """Retrouve les fichiers déjà distribués (même nom et même hash) : nom -> id"""
+        hashes = list({item['hash'] for item in items})
+        existing = {}
+        for file in self.file_model.get_files_by_hashes(hashes, 'distributed'):
+            existing[(file['original_name'], file['file_hash'])] = file['id']
+        return {
+            item['name']: existing[(item['name'], item['hash'])]
+            for item in items
+            if (item['name'], item['hash']) in existing
+        }
+    
+    def get_files_page(self, search: Optional[str] = None, after_id: Optional[int] = None,
+                       limit: int = 50) -> Tuple[List[Dict], Optional[int]]:
+        """Récupère une page de fichiers distribués et le curseur de la page suivante"""
+        files = self.file_model.get_files_page('distributed', search, after_id, limit + 1)
+        next_cursor = None
+        if len(files) > limit:
+            files = files[:limit]
+            next_cursor = files[-1]['id']
+        for file in files:
+            file['size_mb'] = round(file['total_size'] / (1024 * 1024), 2)
+            file['block_size_mb'] = round(file['block_size'] / (1024 * 1024), 2)
+        return files, next_cursor
+    
+    def get_catalog_stats(self) -> Dict:
+        """Statistiques du catalogue (totaux tenus à jour par la base)"""
+        stats = self.file_model.get_files_stats('distributed')
+        stats['total_size_mb'] = round(stats['total_size'] / (1024 * 1024), 2)
+        return stats
+    
     def delete_file(self, file_id: int) -> Tuple[bool, str]:
         """Supprime un fichier et ses blocs"""
         try:
@@ -190,15 +363,12 @@ class FileBlockService:
             blocks = self.block_model.get_blocks_by_file_id(file_id)
             
             # Supprimer les blocs des machines distantes
+            # (les erreurs sont ignorées : le scrubber récupère les orphelins)
             for block in blocks:
-                try:
-                    requests.delete(
-                        f"{block['machine_url']}/delete_block",
-                        params={'path': block['storage_path']},
-                        timeout=30
-                    )
-                except:
-                    pass  # Ignorer les erreurs de suppression distante
+                # Un même fichier envoyé deux fois partage ses blocs
+                if self.block_model.count_blocks_at_location(block['machine_url'], block['storage_path']) > 1:
+                    continue
+                self.delete_block_from_machine(block['machine_url'], block['storage_path'])
             
             # Supprimer de la base de données
             self.block_model.delete_blocks_by_file_id(file_id)
@@ -214,6 +384,7 @@ class MachineService:
     def __init__(self, db_path: str):
         self.db = Database(db_path)
         self.machine_model = MachineModel(self.db)
+        self.block_model = BlockModel(self.db)
     
     def add_machine(self, name: str, url: str, storage_path: str) -> Tuple[bool, str]:
         """Ajoute une nouvelle machine"""
@@ -231,13 +402,21 @@ class MachineService:
         """Récupère la liste des machines"""
         return self.machine_model.get_all_machines()
     
+    def get_machine(self, machine_id: int) -> Optional[Dict]:
+        """Récupère une machine par son identifiant"""
+        return self.machine_model.get_machine_by_id(machine_id)
+    
     def update_machine(self, machine_id: int, name: str, url: str, storage_path: str) -> Tuple[bool, str]:
         """Met à jour une machine"""
         try:
             if not url.startswith('http'):
                 url = 'http://' + url
             
+            previous = self.machine_model.get_machine_by_id(machine_id)
             self.machine_model.update_machine(machine_id, name, url, storage_path)
+            # Les blocs déjà stockés suivent la machine (changement d'IP, de port...)
+            if previous and previous['url'] != url:
+                self.block_model.update_machine_url(previous['url'], url)
             return True, "Machine mise à jour avec succès"
         except Exception as e:
             return False, f"Erreur lors de la mise à jour : {str(e)}"
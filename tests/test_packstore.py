@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packstore import PackStore
+
+
+class PackStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open_store(self):
+        return PackStore(self.root, segment_size=1000)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.root) if name.endswith('.pack'))
+
+    def test_put_get_delete_survive_reload(self):
+        store = self.open_store()
+        store.put('/r/a', b'a' * 10)
+        store.put('/r/b', b'b' * 10)
+        store.put('/r/a', b'new')
+        store.delete('/r/b')
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual(store.get('/r/a'), b'new')
+        self.assertIsNone(store.get('/r/b'))
+        store.close()
+
+    def test_list_pages_in_path_order(self):
+        store = self.open_store()
+        for name in ('c', 'a', 'b', 'd'):
+            store.put(f'/r/{name}', name.encode())
+        store.put('/other/x', b'x')
+
+        first = store.list('/r', limit=3)
+        self.assertEqual([entry['path'] for entry in first], ['/r/a', '/r/b', '/r/c'])
+        rest = store.list('/r', after=first[-1]['path'], limit=3)
+        self.assertEqual([entry['path'] for entry in rest], ['/r/d'])
+        store.close()
+
+    def test_list_follows_puts_and_deletes_across_reload(self):
+        store = self.open_store()
+        for i in range(20):
+            store.put(f'/r/{i:02d}', b'x')
+        store.delete('/r/05')
+        store.put('/r/03', b'replaced')
+        store.close()
+
+        store = self.open_store()
+        store.put('/r/99', b'x')
+        store.delete('/r/10')
+        paths, after = [], ''
+        while True:
+            page = store.list('/r', after=after, limit=4)
+            paths.extend(entry['path'] for entry in page)
+            if len(page) < 4:
+                break
+            after = page[-1]['path']
+        expected = sorted(f'/r/{i:02d}' for i in list(range(20)) + [99] if i not in (5, 10))
+        self.assertEqual(paths, expected)
+        store.close()
+
+    def test_list_name_pattern_skips_other_keys(self):
+        store = self.open_store()
+        for key in ('/r/0_block_1', '/r/notes.txt', '/r/sub/0_block_2'):
+            store.put(key, b'x')
+
+        listed = store.list('/r', name_pattern=re.compile(r'\d+_block_\d+'))
+        self.assertEqual([entry['path'] for entry in listed], ['/r/0_block_1'])
+        store.close()
+
+    def test_compaction_keeps_live_blocks(self):
+        store = self.open_store()
+        for i in range(10):
+            store.put(f'/r/{i}', bytes([i]) * 300)
+        for i in range(8):
+            store.delete(f'/r/{i}')
+        self.assertGreater(store.compact(), 0)
+        self.assertEqual(store.get('/r/8'), bytes([8]) * 300)
+        self.assertEqual(store.get('/r/9'), bytes([9]) * 300)
+        store.close()
+
+    def test_rebuild_after_compaction_does_not_resurrect_deleted_blocks(self):
+        store = self.open_store()
+        # Segment 1 : 'k' et un bloc vivant plus gros, il reste majoritairement vivant
+        store.put('/r/k', b'k' * 100)
+        store.put('/r/live', b'l' * 900)
+        # Segment 2 : tombstone de 'k' et un bloc ensuite supprimé, il devient majoritairement mort
+        store.delete('/r/k')
+        store.put('/r/tmp', b't' * 1000)
+        store.delete('/r/tmp')
+        # Segment 3 : actif
+        store.put('/r/other', b'o' * 10)
+        self.assertEqual(len(self.segments()), 3)
+
+        store.compact()
+        self.assertIn('segment-000001.pack', self.segments())
+        self.assertNotIn('segment-000002.pack', self.segments())
+        store.close()
+
+        os.remove(os.path.join(self.root, 'index.log'))
+        store = self.open_store()
+        self.assertNotIn('/r/k', store.entries)
+        self.assertNotIn('/r/tmp', store.entries)
+        self.assertEqual(store.get('/r/live'), b'l' * 900)
+        self.assertEqual(store.get('/r/other'), b'o' * 10)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+import receiver_app
+from models import init_db
+from scrubber import BlockScrubber
+from services import MachineService
+
+FILE_HASH = hashlib.sha256(b'file').hexdigest()
+OLD = time.time() - 7200
+
+
+class ScrubberGcTest(unittest.TestCase):
+    """Nettoyage des orphelins contre un vrai receiver (backend fichiers)"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        cls.server = make_server('127.0.0.1', 0, receiver_app.app, threaded=True)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = os.path.join(self.tmp.name, 'blocks')
+        os.makedirs(self.storage)
+        self.db_path = os.path.join(self.tmp.name, 'test.db')
+        init_db(self.db_path)
+        self.machines = MachineService(self.db_path)
+        self.machines.add_machine('r1', self.url, self.storage)
+        self.machine = self.machines.machine_model.get_active_machines()[0]
+        self.scrubber = BlockScrubber(self.db_path, orphan_grace_seconds=3600, gc_page_size=2, gc_page_delay=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name: str, mtime: float = OLD) -> str:
+        path = os.path.join(self.storage, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def add_known_blocks(self, count: int):
+        for number in range(count):
+            name = f'{FILE_HASH}_block_{number}'
+            self.write(name)
+            self.machines.block_model.create_block(
+                1, number, 'h', 4, self.machine['url'], f"{self.machine['storage_path']}/{name}"
+            )
+
+    def test_only_block_names_are_collected(self):
+        self.add_known_blocks(5)
+        orphan = self.write(f'{FILE_HASH}_block_9')
+        notes = self.write('notes.txt')
+        nested = self.write(f'sub/{FILE_HASH}_block_7')
+
+        report = self.scrubber.run_once(force_gc=True)
+
+        self.assertEqual((report['orphans'], report['deleted']), (1, 1))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(notes))
+        self.assertTrue(os.path.exists(nested))
+        self.assertEqual(len(os.listdir(self.storage)), 7)
+
+    def test_collect_orphans_ignores_foreign_paths_from_receiver(self):
+        # Un receiver plus ancien peut renvoyer des fichiers qui ne sont pas des blocs
+        self.add_known_blocks(5)
+        listed = [
+            {'path': f'{self.storage}/notes.txt', 'mtime': OLD},
+            {'path': f'{self.storage}/sub/{FILE_HASH}_block_7', 'mtime': OLD},
+        ]
+        self.scrubber.file_service.list_blocks_on_machine = lambda *args: (listed, None)
+        deleted = []
+        self.scrubber.file_service.delete_block_from_machine = lambda url, path: deleted.append(path) or True
+
+        report = self.scrubber.collect_orphans()
+
+        self.assertEqual(report['deleted'], 0)
+        self.assertEqual(deleted, [])
+
+    def test_recent_orphans_are_kept(self):
+        self.add_known_blocks(5)
+        recent = self.write(f'{FILE_HASH}_block_9', mtime=time.time())
+
+        report = self.scrubber.run_once(force_gc=True)
+
+        self.assertEqual(report['deleted'], 0)
+        self.assertTrue(os.path.exists(recent))
+
+    def test_too_many_orphans_skip_the_machine(self):
+        self.add_known_blocks(1)
+        orphans = [self.write(f'{FILE_HASH}_block_{number}') for number in range(10, 14)]
+
+        report = self.scrubber.run_once(force_gc=True)
+
+        self.assertEqual(report['deleted'], 0)
+        self.assertEqual(report['skipped_machines'], ['r1'])
+        self.assertTrue(all(os.path.exists(path) for path in orphans))
+
+    def test_url_change_keeps_blocks_attached(self):
+        self.add_known_blocks(5)
+        # Même receiver, autre URL (localhost au lieu de 127.0.0.1)
+        new_url = self.url.replace('127.0.0.1', 'localhost')
+        self.machines.update_machine(self.machine['id'], 'r1', new_url, self.storage)
+
+        self.assertFalse(self.machines.block_model.machine_has_blocks(self.url))
+        report = self.scrubber.run_once(force_gc=True)
+
+        self.assertEqual(report['deleted'], 0)
+        self.assertEqual(len(os.listdir(self.storage)), 5)
+
+    def test_machine_without_known_blocks_is_skipped(self):
+        self.write(f'{FILE_HASH}_block_0')
+
+        report = self.scrubber.run_once(force_gc=True)
+
+        self.assertEqual(report['deleted'], 0)
+        self.assertEqual(len(os.listdir(self.storage)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()